@@ -16,12 +16,35 @@
 # -** REQUIRED LIBRARIES **-
 # --------------------------
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import pandas as pd
 import numpy as np
 from plotly import graph_objects as go
-import plotly.express as px
 from plotly.subplots import make_subplots
 
+# Numba is optional. Without it, rules are checked with the vectorised NumPy functions below.
+try:
+    from numba import njit
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # No-op stand-in for numba.njit (supports both @njit and @njit(...)).
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# tsdownsample is optional. Without it, long series are downsampled for plotting by keeping the minimum and
+# maximum point of each bucket (see SPC._render_data).
+try:
+    from tsdownsample import MinMaxLTTBDownsampler
+    _TSDOWNSAMPLE_AVAILABLE = True
+except ImportError:
+    _TSDOWNSAMPLE_AVAILABLE = False
+
 '''
 
 ------------------
@@ -37,9 +60,184 @@ from plotly.subplots import make_subplots
 '''
 
 
+# -------------------------------
+# -** CONTROL CHART CONSTANTS **-
+# -------------------------------
+
+# Reference table for X_bar chart control limits calculations. Different sample size will result in
+# different control limits for the xbar charts. Each array is indexed by sample size (2 to 25).
+
+X_BAR_CONSTS = {
+    'A2': np.array([np.nan, np.nan, 1.88, 1.023, 0.729, 0.577, 0.483, 0.419, 0.373, 0.337, 0.308, 0.285, 0.266,
+                    0.249, 0.235, 0.223, 0.212, 0.203, 0.194, 0.187, 0.18, 0.173, 0.167, 0.162, 0.157, 0.153]),
+    'A3': np.array([np.nan, np.nan, 2.659, 1.954, 1.628, 1.427, 1.287, 1.182, 1.099, 1.032, 0.975, 0.927, 0.886,
+                    0.85, 0.817, 0.789, 0.763, 0.739, 0.718, 0.698, 0.68, 0.663, 0.647, 0.633, 0.619, 0.606]),
+    'd2': np.array([np.nan, np.nan, 1.128, 1.693, 2.059, 2.326, 2.534, 2.704, 2.847, 2.97, 3.078, 3.173, 3.258,
+                    3.336, 3.407, 3.472, 3.532, 3.588, 3.64, 3.689, 3.735, 3.778, 3.819, 3.858, 3.895, 3.931]),
+    'D3': np.array([np.nan, np.nan, 0.0, 0.0, 0.0, 0.0, 0.0, 0.076, 0.136, 0.184, 0.223, 0.256, 0.283, 0.307,
+                    0.328, 0.347, 0.363, 0.378, 0.391, 0.403, 0.415, 0.425, 0.434, 0.443, 0.451, 0.459]),
+    'D4': np.array([np.nan, np.nan, 3.267, 2.574, 2.282, 2.114, 2.004, 1.924, 1.864, 1.816, 1.777, 1.744, 1.717,
+                    1.693, 1.672, 1.653, 1.637, 1.622, 1.608, 1.597, 1.585, 1.575, 1.566, 1.557, 1.548, 1.541]),
+    'B3': np.array([np.nan, np.nan, 0.0, 0.0, 0.0, 0.0, 0.03, 0.118, 0.185, 0.239, 0.284, 0.321, 0.354, 0.382,
+                    0.406, 0.428, 0.448, 0.466, 0.482, 0.497, 0.51, 0.523, 0.534, 0.545, 0.555, 0.565]),
+    'B4': np.array([np.nan, np.nan, 3.267, 2.568, 2.266, 2.089, 1.97, 1.882, 1.815, 1.761, 1.716, 1.679, 1.646,
+                    1.618, 1.594, 1.572, 1.552, 1.534, 1.518, 1.503, 1.49, 1.477, 1.466, 1.455, 1.445, 1.435])}
+
+
+# SPC chart types available.
+CHART_TYPES = ('XmR-chart', 'Individual-chart', 'p-chart', 'np-chart', 'c-chart', 'u-chart', 'XbarR-chart',
+               'XbarS-chart')
+
+# Control lines drawn on every chart: (column, line colour, line width, trace name).
+CONTROL_LINE_STYLES = (('cl', 'green', 3, 'CENTRAL LINE'),
+                       ('lcl', 'red', 2, 'LOWER CONTROL LINE'),
+                       ('ucl', 'red', 2, 'UPPER CONTROL LINE'))
+
+# Chart panels with more points than this are drawn with WebGL (go.Scattergl) rather than SVG: the value line,
+# control lines and rule markers alike.
+WEBGL_MIN_POINTS = 10000
+
+@lru_cache(maxsize=None)
+def _xbar(name, sample_size):
+    # Cached scalar lookup of an X-bar chart constant for a given sample size.
+    return float(X_BAR_CONSTS[name][sample_size])
+
+
+@lru_cache(maxsize=256)
+def _tsdate(date):
+    # Cached pd.to_datetime for single (hashable) dates, e.g. the baseline date.
+    return pd.to_datetime(date)
+
+
+def _chart_type_error(chart_type):
+    # Error for an unsupported chart type, listing the CHART_TYPES available.
+    return ValueError(f'Unknown chart_type={chart_type!r}. Chart type must be one of '
+                      + ', '.join(f'"{name}"' for name in CHART_TYPES))
+
+
+# ----------------------
+# -** RULE FUNCTIONS **-
+# ----------------------
+
+# Compiled single-threaded: the run counters carry state from one point to the next, so parallel=True
+# would not help (and nested parallel regions are known to slow Numba down). The fastmath flags exclude
+# 'nnan'/'ninf', as missing values must still compare as False. nogil lets other threads run meanwhile.
+@njit(cache=True, nogil=True, parallel=False, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'})
+def _check_rules(y, cl, ucl, lcl, plus1sd, plus2sd, minus2sd):
+
+    """
+
+    Checks the 5 SPC rules in a single pass over the data, keeping a running count for each rule
+    (compiled with Numba when it is installed).
+
+    Args:
+        y (numpy.ndarray): Values of the process being analysed.
+        cl, ucl, lcl, plus1sd, plus2sd, minus2sd (numpy.ndarray): Control lines for each point.
+
+    Returns:
+        numpy.ndarray: (n, 5) uint8 matrix of flags, one column per rule (Rule 1-5), set to 1 where the
+        point completes a rule violation.
+
+    """
+
+    n = y.shape[0]
+    flags = np.zeros((n, 5), dtype=np.uint8)
+
+    run_above = 0
+    run_below = 0
+    run_up = 0
+    run_down = 0
+    run_within = 0
+    # Last 3 points beyond +2 sigma (or -2 sigma), stored as a circular buffer.
+    ring_above = np.zeros(3, dtype=np.int64)
+    ring_below = np.zeros(3, dtype=np.int64)
+    count_above = 0
+    count_below = 0
+
+    for i in range(n):
+
+        # Rule 1: Point outside the +/- 3 sigma limits
+        flags[i, 0] = (y[i] > ucl[i]) or (y[i] < lcl[i])
+
+        # Rule 2: 8 successive consecutive points above (or below) the centre line
+        run_above = run_above + 1 if y[i] > cl[i] else 0
+        run_below = run_below + 1 if y[i] < cl[i] else 0
+        flags[i, 1] = (run_above >= 8) or (run_below >= 8)
+
+        # Rule 3: 6 or more consecutive points steadily increasing or decreasing
+        if i > 0:
+            run_up = run_up + 1 if y[i] > y[i - 1] else 0
+            run_down = run_down + 1 if y[i] < y[i - 1] else 0
+        flags[i, 2] = (run_up >= 5) or (run_down >= 5)
+
+        # Rule 4: 2 out of 3 successive points beyond +/- 2 sigma limits
+        slot = i % 3
+        new_above = 1 if y[i] > plus2sd[i] else 0
+        new_below = 1 if y[i] < minus2sd[i] else 0
+        count_above += new_above - ring_above[slot]
+        count_below += new_below - ring_below[slot]
+        ring_above[slot] = new_above
+        ring_below[slot] = new_below
+        flags[i, 3] = (i >= 2) and ((count_above >= 2) or (count_below >= 2))
+
+        # Rule 5: 15 consecutive points within +/- 1 sigma on either side of the centre line
+        run_within = run_within + 1 if abs(y[i] - cl[i]) <= plus1sd[i] - cl[i] else 0
+        flags[i, 4] = run_within >= 15
+
+    return flags
+
+
+def _window_count(mask, window):
+
+    """
+
+    Counts True values over each full window of a boolean array. Positions without a full window
+    behind them are given a count of 0.
+
+    """
+
+    # Window counts are differences of one running total, so the cost does not grow with the window.
+    counts = np.zeros(len(mask), dtype=np.int32)
+    if len(mask) >= window:
+        totals = np.cumsum(mask, dtype=np.int32)
+        counts[window - 1] = totals[window - 1]
+        np.subtract(totals[window:], totals[:-window], out=counts[window:])
+    return counts
+
+
+def _check_rules_numpy(y, cl, ucl, lcl, plus1sd, plus2sd, minus2sd):
+
+    """
+
+    Vectorised NumPy version of _check_rules(), used when Numba is not installed.
+
+    """
+
+    # Rule 1: Point outside the +/- 3 sigma limits
+    rule1 = (y > ucl) | (y < lcl)
+
+    # Rule 2: 8 successive consecutive points above (or below) the centre line
+    rule2 = (_window_count(y > cl, 8) == 8) | (_window_count(y < cl, 8) == 8)
+
+    # Rule 3: 6 or more consecutive points steadily increasing or decreasing
+    # (5 successive rising/falling differences span 6 points)
+    diffs = np.diff(y)
+    rule3 = np.zeros(len(y), dtype=bool)
+    rule3[1:] = (_window_count(diffs > 0, 5) == 5) | (_window_count(diffs < 0, 5) == 5)
+
+    # Rule 4: 2 out of 3 successive points beyond +/- 2 sigma limits
+    rule4 = (_window_count(y > plus2sd, 3) >= 2) | (_window_count(y < minus2sd, 3) >= 2)
+
+    # Rule 5: 15 consecutive points within +/- 1 sigma on either side of the centre line
+    rule5 = _window_count(np.abs(y - cl) <= plus1sd - cl, 15) == 15
+
+    return np.column_stack((rule1, rule2, rule3, rule4, rule5)).view(np.uint8)
+
+
 class SPC:
 
-    def __init__(self, data_in, target_col, chart_type='Individual-chart', change_dates=None, baseline_date=None):
+    def __init__(self, data_in, target_col, chart_type='Individual-chart', change_dates=None, baseline_date=None,
+                 precision='float64', n_jobs=1, max_render_points=None, combine_rule_markers=False):
 
         """
 
@@ -79,16 +277,61 @@ class SPC:
 
              baseline_date (str) (OPTIONAL): Data before this date will be used to calculate the control lines.
 
+             precision (str) (OPTIONAL): Floating point precision of the control lines of the Individual, XmR,
+             p- and u-charts (including the moving range and sigma calculations), "float64" (default) or
+             "float32". float32 halves the memory used by these columns; the difference it makes to the control
+             lines is far smaller than the 3 sigma limits. Other chart types always use float64.
+
+             n_jobs (int) (OPTIONAL): Number of threads used to calculate the control lines of each period
+             when change_dates is given (1 by default, -1 to use all CPUs).
+
+             max_render_points (int) (OPTIONAL): If set (to at least 3), the value line of charts with more
+             points than this is downsampled for plotting (using MinMaxLTTB from tsdownsample, if installed).
+             Control lines are only thinned where they are constant, and rule checks and the output data always
+             use every point.
+
+             combine_rule_markers (bool) (OPTIONAL): If True, the rule violations of each chart are drawn as one
+             marker trace (the rule is shown on hover), rather than one trace per rule in the legend.
+
 
         """
 
-        self.data_in = data_in.copy()
+        # Not copied: the input frame is only read, and any conversion of its index makes a new frame.
+        self.data_in = data_in
         self.target_col = target_col
+        if chart_type not in CHART_TYPES:
+            raise _chart_type_error(chart_type)
         self.chart_type = chart_type
         self.change_dates = change_dates
         self.baseline_date = baseline_date
+        if precision not in ('float64', 'float32'):
+            raise ValueError('precision must be one of "float64", "float32"')
+        self.precision = precision
+        if isinstance(n_jobs, bool) or not isinstance(n_jobs, (int, np.integer)) or not (n_jobs >= 1 or n_jobs == -1):
+            raise ValueError('n_jobs must be a positive integer, or -1 to use all CPUs')
+        self.n_jobs = n_jobs
+        if max_render_points is not None and (isinstance(max_render_points, bool)
+                                              or not isinstance(max_render_points, (int, np.integer))
+                                              or max_render_points < 3):
+            raise ValueError('max_render_points must be None or an integer of at least 3')
+        self.max_render_points = max_render_points
+        self.combine_rule_markers = combine_rule_markers
         self.rules_table = None
-        self.spc_data = None
+
+        self._spc_data_cache = None
+        # Whether data_in has been through the DQ checks (reset, with the setup() cache, when data_in is assigned).
+        self._data_checked = False
+        self._setup_key = None
+
+        # Method calculating the control lines of each chart type.
+        self._dispatch = {'XmR-chart': self._build_xmr,
+                          'Individual-chart': self._build_xmr,
+                          'XbarR-chart': self._build_xbar_r,
+                          'XbarS-chart': self._build_xbar_s,
+                          'c-chart': self._build_c,
+                          'p-chart': self._build_p,
+                          'np-chart': self._build_np,
+                          'u-chart': self._build_u}
 
         self._data_y = None
         self._data_x = None
@@ -124,18 +367,27 @@ class SPC:
         # -** Checking data/alerting user of potential issues.**-
         # ------------------------------------------------------
 
-        if (data_in.index.value_counts() > 1).any():
+        # Count the rows on each date once, then reuse the counts for the checks below.
+        date_counts = np.unique(data_in.index.to_numpy(), return_counts=True)[1]
+
+        if (date_counts > 1).any():
             print('Duplicate dates detected.')
 
-            if data_in.index.value_counts().min() == data_in.index.value_counts().max():
-                print(f'Constant sample size = {data_in.index.value_counts()[0]}')
-                self.sample_size = data_in.index.value_counts()[0]
+            if date_counts.min() == date_counts.max():
+                print(f'Constant sample size = {date_counts[0]}')
+                self.sample_size = int(date_counts[0])
 
         if len(data_in) <= 20:
             print('Less than 20 data points detected. Consider collecting more data before using this tool.')
 
+        # Check for DQ issues, and convert the index to datetime if needed, before it is searched below
+        # (setup() then skips the check for this data).
+        self._data_in = self._clean_time_series_data(self.data_in)
+        self._data_checked = True
+
         if self.baseline_date is not None:
-            if len(data_in.copy().loc[:pd.to_datetime(self.baseline_date)]) < 20:
+            # Rows up to and including the baseline date, found by binary search on the (sorted) index.
+            if self.data_in.index.searchsorted(_tsdate(self.baseline_date), side='right') < 20:
                 print('Less than 20 data points detected in baseline period. Consider adding more \
                 data pre-baseline.')
 
@@ -147,11 +399,55 @@ class SPC:
         fig = self.plot_spc(title=title)
         self.spc_chart = fig
 
+    @property
+    def spc_data(self):
+
+        """
+
+        Control lines and rule violations for each chart, combined into one dataframe. Built on first
+        access after check_rules() (None before then). The dataframe is a copy of the internal chart data, so
+        it can be modified (or replaced, by assigning to spc_data) without affecting the SPC object.
+
+        """
+
+        if self._spc_data_cache is None and self._data_x is not None:
+            # Single chart types have nothing to combine, but are still copied (as the concat of two charts
+            # is a new frame), so that changes to spc_data cannot reach the internal chart data.
+            if self._data_y is None:
+                self._spc_data_cache = self._data_x.copy()
+            else:
+                self._spc_data_cache = pd.concat([self._data_x, self._data_y], ignore_index=True)
+        return self._spc_data_cache
+
+    @spc_data.setter
+    def spc_data(self, value):
+        # Replaces the combined dataframe (until the next check_rules() call rebuilds it).
+        self._spc_data_cache = value
+
+    @property
+    def data_in(self):
+
+        """
+
+        Data to analyse. Assigning a dataframe (even the same one, after modifying it in place) makes the
+        next setup() call check it and recalculate the control lines.
+
+        """
+
+        return self._data_in
+
+    @data_in.setter
+    def data_in(self, value):
+        self._data_in = value
+        self._data_checked = False
+        self._setup_key = None
+
     # -------------------------
     # -** UTILITY FUNCTIONS **-
     # -------------------------
 
-    def _rules_func(input_df, target_col):
+    @staticmethod
+    def _rules_func(y, cl, ucl, lcl, plus1sd, plus2sd, minus2sd, index):
 
         """
 
@@ -160,54 +456,146 @@ class SPC:
 
         !! Can add rules as requested.
 
+        Args:
+            y (numpy.ndarray): Values of the target column.
+            cl, ucl, lcl (numpy.ndarray): Centre line, upper and lower control limits.
+            plus1sd, plus2sd, minus2sd (numpy.ndarray): +1, +2 and -2 sigma lines.
+            index (pandas.Index): Dates corresponding to each value.
+
+        Returns:
+            dict: Dictionary of rule violations with Rule 1-5 as keys, and dates (as a DatetimeIndex) as values.
+
+        """
+
+        if _NUMBA_AVAILABLE:
+            flags = _check_rules(y, cl, ucl, lcl, plus1sd, plus2sd, minus2sd)
+        else:
+            flags = _check_rules_numpy(y, cl, ucl, lcl, plus1sd, plus2sd, minus2sd)
+
+        # One scan of the flag matrix gives the (rule, position) of every violation, ordered by rule
+        # and then by position, so each rule's dates are one contiguous slice.
+        rules, positions = np.nonzero(flags.T)
+        bounds = np.searchsorted(rules, np.arange(flags.shape[1] + 1))
+
+        violations = {}
+        for rule_number, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]), start=1):
+            violations[f'Rule {rule_number} violation'] = index[positions[start:end]]
+
+        return violations
+
+    @staticmethod
+    def _rule_inputs(input_df, target_col):
+
+        """
+
+        Extracts the arrays needed by _rules_func() from a formatted chart dataframe.
+
         Args:
             input_df (pandas.DataFrame): Data to analyse.
             target_col (str): Name of target column.
 
         Returns:
-            dict: Dictionary of rule violations with Rule 1-5 as keys, and dates as values.
+            list: Target and control line arrays (float64), followed by the dataframe index.
 
         """
 
-        violations = {}
+        arrays = [input_df[col].to_numpy(dtype=np.float64)
+                  for col in (target_col, 'cl', 'ucl', 'lcl', '+1sd', '+2sd', '-2sd')]
+        return [*arrays, input_df.index]
 
-        # Rule 1: Point outside the +/- 3 sigma limits
-        rule1 = (input_df[target_col] > input_df['ucl']) | (input_df[target_col] < input_df['lcl'])
-        violations['Rule 1 violation'] = input_df.index[rule1].tolist()
+    @staticmethod
+    def _assign_columns(df, columns, dtype=None):
 
-        # Rule 2: 8 successive consecutive points above (or below) the centre line
-        rule2 = []
-        for i in range(7, len(input_df)):
-            subset = input_df.iloc[i - 7:i + 1]
-            if (subset[target_col] > subset['cl']).all() or (subset[target_col] < subset['cl']).all():
-                rule2.append(input_df.index[i])
-        violations['Rule 2 violation'] = rule2
+        """
 
-        # Rule 3: 6 or more consecutive points steadily increasing or decreasing
-        rule3 = []
-        for i in range(5, len(input_df)):
-            subset = input_df.iloc[i - 5:i + 1]
-            if np.all(np.diff(subset[target_col]) > 0) or np.all(np.diff(subset[target_col]) < 0):
-                rule3.append(input_df.index[i])
-        violations['Rule 3 violation'] = rule3
+        Adds several columns to a dataframe in a single assignment (rather than one column at a time).
 
-        # Rule 4: 2 out of 3 successive points beyond +/- 2 sigma limits
-        rule4 = []
-        for i in range(2, len(input_df)):
-            subset = input_df.iloc[i - 2:i + 1]
-            if ((subset[target_col] > subset['+2sd']).sum() >= 2) or ((subset[target_col] < subset['-2sd']).sum() >= 2):
-                rule4.append(input_df.index[i])
-        violations['Rule 4 violation'] = rule4
+        Args:
+            df (pandas.DataFrame): Dataframe to add the columns to (updated in place).
+            columns (dict): Column names, mapped to a scalar or an array with one value per row.
+            dtype (str): dtype of the new columns (by default, the common type of the values).
 
-        # Rule 5: 15 consecutive points within +/- 1 sigma on either side of the centre line
-        rule5 = []
-        for i in range(14, len(input_df)):
-            subset = input_df.iloc[i - 14:i + 1]
-            if np.all(np.abs(subset[target_col] - subset['cl']) <= subset['+1sd'] - subset['cl']):
-                rule5.append(input_df.index[i])
-        violations['Rule 5 violation'] = rule5
+        """
 
-        return violations
+        values = [np.broadcast_to(value, len(df)) for value in columns.values()]
+        if dtype is None:
+            block = np.column_stack(values)
+        else:
+            # Filled column by column, so no wider temporary block is built.
+            block = np.empty((len(df), len(values)), dtype=dtype)
+            for i, value in enumerate(values):
+                block[:, i] = value
+        df[list(columns)] = block
+
+    @staticmethod
+    def _sigma_lines(centre, sigma, clamp_lcl=True):
+
+        """
+
+        Calculates the centre line and the lines at +/- 1, 2 and 3 sigma from it, with a single
+        broadcast multiply-add.
+
+        Args:
+            centre (float): Centre line.
+            sigma (float or numpy.ndarray): Sigma, as a scalar or with one value per row.
+            clamp_lcl (bool): Whether the lcl is not allowed to fall below 0 (np.fmax also sets any
+                missing lcl to 0).
+
+        Returns:
+            dict: Control lines ('cl', 'lcl', 'ucl', '+1sd', '-1sd', '+2sd', '-2sd'), for _assign_columns().
+
+        """
+
+        # (the lines are calculated at the precision of the centre line and sigma)
+        multiples = np.array([-3, 3, 1, -1, 2, -2], dtype=np.result_type(centre, sigma))
+        limits = centre + multiples[:, None] * np.atleast_1d(sigma)
+        if clamp_lcl:
+            limits[0] = np.fmax(limits[0], 0)
+        return {'cl': centre, 'lcl': limits[0], 'ucl': limits[1], '+1sd': limits[2], '-1sd': limits[3],
+                '+2sd': limits[4], '-2sd': limits[5]}
+
+    @staticmethod
+    def _per_sample(data, target_col):
+
+        """
+
+        Divides the target column by the sample size column 'n', in place on a single array copy.
+
+        Args:
+            data (pandas.DataFrame): Data with the target and 'n' columns.
+            target_col (str): Name of target column.
+
+        Returns:
+            numpy.ndarray: Target value per unit of sample size.
+
+        """
+
+        values = data[target_col].to_numpy(dtype=np.float64, copy=True)
+        # (a sample size of 0 gives inf/NaN silently, as with pandas division)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(values, data['n'].to_numpy(), out=values)
+        return values
+
+    @staticmethod
+    def _date_flags(index, dates):
+
+        """
+
+        Flags the rows of an index whose date is in a list of dates.
+
+        Args:
+            index (pandas.Index): Dates to flag.
+            dates (list): Dates to look for (dates not in the index are ignored).
+
+        Returns:
+            numpy.ndarray: uint8 array, 1 where the date is in the list and 0 otherwise.
+
+        """
+
+        positions = index.get_indexer_for(dates)
+        flags = np.zeros(len(index), dtype=np.uint8)
+        flags[positions[positions >= 0]] = 1
+        return flags
 
     def _clean_time_series_data(self, data):
 
@@ -218,21 +606,44 @@ class SPC:
         Args:
             data (pandas.DataFrame): Data to analyse.
 
+        Returns:
+            pandas.DataFrame: The data, with a datetime index (a new frame only if the index was converted).
+
         """
 
-        # Check if index is in pandas datetime format
-        if pd.api.types.is_datetime64_any_dtype(data.index):
+        # Check if index is in pandas datetime format (and only convert it if it is not)
+        if not pd.api.types.is_datetime64_any_dtype(data.index):
             try:
-                data.index = pd.to_datetime(data.index)
+                data = data.set_axis(pd.to_datetime(data.index), axis=0)
             except ValueError:
                 raise ValueError(f"Index not in required format. Please use datetime index.")
 
-        # Check for missing data
-        missing_values = data.isnull().sum()
-
-        if missing_values.any():
+        # Check for missing data, in the columns the control lines are calculated from (the per-column
+        # counts are only needed if any are missing)
+        columns = [column for column in (self.target_col, 'n') if column in data.columns]
+        missing = data[columns].isna()
+        if missing.values.any():
             print("Missing values detected:")
-            print(missing_values)
+            print(missing.sum())
+
+        return data
+
+    def _setup_cache_key(self):
+
+        """
+
+        Inputs (other than data_in) which determine the output of setup(). Assigning data_in clears the
+        cache instead, so after modifying data_in in place, assign it again (spc.data_in = spc.data_in)
+        for the control lines to be recalculated.
+
+        Returns:
+            tuple: Cache key.
+
+        """
+
+        change_dates = None if self.change_dates is None else tuple(self.change_dates)
+        return (self.target_col, self.chart_type, change_dates, self.baseline_date, self.precision,
+                getattr(self, 'sample_size', None))
 
     # -----------------------
     # -** MAIN CLASS CODE **-
@@ -247,11 +658,27 @@ class SPC:
 
         If change_dates is not specified, it runs only once.
 
+        If none of the inputs have changed since the last call, the control lines already calculated are kept.
+
 
         """
 
-        # Firstly, we check for any DQ issues using _clean_time_series_data().
-        self._clean_time_series_data(self.data_in)
+        if self._formatted_data_x is not None and self._setup_key == self._setup_cache_key():
+            return
+
+        # Firstly, we check for any DQ issues using _clean_time_series_data() (only once if setup() is re-run,
+        # unless data_in has been assigned since).
+        if not self._data_checked:
+            self._data_in = self._clean_time_series_data(self.data_in)
+            self._data_checked = True
+
+        # Columns tested by check_rules() for each chart (the second chart always plots 'r').
+        if self.chart_type in ("XmR-chart", "XbarR-chart", "XbarS-chart"):
+            self._target_col_x = self.target_col
+            self._target_col_y = 'r'
+        else:
+            self._target_col_x = self.target_col
+            self._target_col_y = None
 
         # Check input arguments to determine number of runs of the _setup_single_run() method.
         if self.change_dates is None:
@@ -260,27 +687,32 @@ class SPC:
             self._formatted_data_x = formatted_x_out
             self._formatted_data_y = formatted_y_out
         else:
-            list_dates = [self.data_in.index[0]] + self.change_dates + [self.data_in.index[-1]]
-            list_dataframes = []
-            for idx in range(0, len(list_dates) - 1):
-                if idx == len(list_dates) - 2:
-                    list_dataframes.append(self.data_in.loc[list_dates[idx]:(pd.to_datetime(list_dates[idx + 1]))])
-                else:
-                    list_dataframes.append(self.data_in.loc[list_dates[idx]:(pd.to_datetime(list_dates[idx + 1]) - \
-                                                                             pd.DateOffset(days=1))])
-
-            formatted_x = []
-            formatted_y = []
-            for data in list_dataframes:
-                formatted_x_out, formatted_y_out = self._setup_single_run(data=data)
-                formatted_x.append(formatted_x_out)
-                formatted_y.append(formatted_y_out)
+            # Find where each change date falls in the (sorted) index with one binary search, then split
+            # the data by position. Each period runs up to, but not including, the next change date.
+            bounds = [0, *self.data_in.index.searchsorted(pd.to_datetime(self.change_dates)), len(self.data_in)]
+            list_dataframes = [self.data_in.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+            # Each period is independent, so they can be calculated in a pool of threads.
+            if self.n_jobs == 1 or len(list_dataframes) == 1:
+                results = [self._setup_single_run(data=data) for data in list_dataframes]
+            else:
+                with ThreadPoolExecutor(max_workers=None if self.n_jobs == -1 else self.n_jobs) as pool:
+                    results = list(pool.map(self._setup_single_run, list_dataframes))
+            formatted_x = [formatted_x_out for formatted_x_out, _ in results]
+            formatted_y = [formatted_y_out for _, formatted_y_out in results]
             self._formatted_data_x = pd.concat(formatted_x)
             if all(x is None for x in formatted_y):
                 self._formatted_data_y = None
             else:
                 self._formatted_data_y = pd.concat(formatted_y)
 
+        # If we're not using baseline data, the baseline date is the last date of the input data.
+        if (self.baseline_date is None) or (self.change_dates is not None):
+            self.baseline_date = self.data_in.index[-1]
+
+        # Keyed after the baseline date is filled in, so that an unchanged re-run is a cache hit.
+        self._setup_key = self._setup_cache_key()
+
     def _setup_single_run(self, data):
 
         """
@@ -288,7 +720,7 @@ class SPC:
        Type of SPC chart currently available:
        "XmR-chart", "Individual-chart", "p-chart", "np-chart",  "c-chart", "u-chart", "XbarR-chart", XbarS-chart"
 
-       !! Can add chart types as requested.
+       !! Can add chart types as requested (as a _build_*() method, added to self._dispatch).
 
        Returns dataframe with control limits, upper/lower as well zones A, B, C which are the 3 zones between the
        upper/lower limits and the center line.
@@ -302,357 +734,278 @@ class SPC:
 
        """
 
-        # Reference dictionary for X_bar chart control limits calculations. Different sample size will result in
-        # different control limits for the xbar charts.
-
-        x_bar_vals = {'A2': {2: '1.88', 3: '1.023', 4: '0.729', 5: '0.577', 6: '0.483', 7: '0.419',
-                             8: '0.373', 9: '0.337', 10: '0.308', 11: '0.285', 12: '0.266',
-                             13: '0.249', 14: '0.235', 15: '0.223', 16: '0.212', 17: '0.203',
-                             18: '0.194', 19: '0.187', 20: '0.18', 21: '0.173', 22: '0.167',
-                             23: '0.162', 24: '0.157', 25: '0.153'},
-                      'A3': {2: '2.659', 3: '1.954', 4: '1.628', 5: '1.427', 6: '1.287', 7: '1.182',
-                             8: '1.099', 9: '1.032', 10: '0.975', 11: '0.927', 12: '0.886', 13: '0.85',
-                             14: '0.817', 15: '0.789', 16: '0.763', 17: '0.739', 18: '0.718',
-                             19: '0.698', 20: '0.68', 21: '0.663', 22: '0.647', 23: '0.633',
-                             24: '0.619', 25: '0.606'},
-                      'd2': {2: '1.128', 3: '1.693', 4: '2.059', 5: '2.326', 6: '2.534', 7: '2.704',
-                             8: '2.847', 9: '2.97', 10: '3.078', 11: '3.173', 12: '3.258', 13: '3.336',
-                             14: '3.407', 15: '3.472', 16: '3.532', 17: '3.588', 18: '3.64', 19: '3.689',
-                             20: '3.735', 21: '3.778', 22: '3.819', 23: '3.858', 24: '3.895',
-                             25: '3.931'},
-                      'D3': {2: '0', 3: '0', 4: '0', 5: '0', 6: '0', 7: '0.076', 8: '0.136',
-                             9: '0.184', 10: '0.223', 11: '0.256', 12: '0.283', 13: '0.307',
-                             14: '0.328', 15: '0.347', 16: '0.363', 17: '0.378', 18: '0.391',
-                             19: '0.403', 20: '0.415', 21: '0.425', 22: '0.434', 23: '0.443',
-                             24: '0.451', 25: '0.459'},
-                      'D4': {2: '3.267', 3: '2.574', 4: '2.282', 5: '2.114', 6: '2.004', 7: '1.924',
-                             8: '1.864', 9: '1.816', 10: '1.777', 11: '1.744', 12: '1.717',
-                             13: '1.693', 14: '1.672', 15: '1.653', 16: '1.637', 17: '1.622',
-                             18: '1.608', 19: '1.597', 20: '1.585', 21: '1.575', 22: '1.566',
-                             23: '1.557', 24: '1.548', 25: '1.541'},
-                      'B3': {2: '0', 3: '0', 4: '0', 5: '0', 6: '0.03', 7: '0.118', 8: '0.185',
-                             9: '0.239', 10: '0.284', 11: '0.321', 12: '0.354', 13: '0.382',
-                             14: '0.406', 15: '0.428', 16: '0.448', 17: '0.466', 18: '0.482',
-                             19: '0.497', 20: '0.51', 21: '0.523', 22: '0.534', 23: '0.545',
-                             24: '0.555', 25: '0.565'},
-                      'B4': {2: '3.267', 3: '2.568', 4: '2.266', 5: '2.089', 6: '1.97',
-                             7: '1.882', 8: '1.815', 9: '1.761', 10: '1.716', 11: '1.679',
-                             12: '1.646', 13: '1.618', 14: '1.594', 15: '1.572', 16: '1.552',
-                             17: '1.534', 18: '1.518', 19: '1.503', 20: '1.49', 21: '1.477',
-                             22: '1.466', 23: '1.455', 24: '1.445', 25: '1.435'}}
-
-        # If we're not using baseline data, we set baseline data to last value of input data.
-        if self.change_dates is not None:
-            self.baseline_date = data.index[-1]
-
-        if (self.baseline_date is None) & (self.change_dates is None):
-            self.baseline_date = data.index[-1]
-
-        if (self.chart_type == 'Individual-chart') or (self.chart_type == 'XmR-chart'):
-
-            baseline_data = data.copy().loc[:pd.to_datetime(self.baseline_date), :]
-            baseline_data['mR'] = data[self.target_col].diff().abs().loc[:pd.to_datetime(self.baseline_date)]
-
-            # Individual chart
-            data_I = data.copy()
-            data_I['cl'] = baseline_data[self.target_col].mean()
-            data_I['lcl'] = baseline_data[self.target_col].mean() - 3 * (
-                    (baseline_data['mR'].iloc[1:len(baseline_data['mR'])]) /
-                    1.128).mean()
-            data_I['ucl'] = baseline_data[self.target_col].mean() + 3 * (
-                    (baseline_data['mR'].iloc[1:len(baseline_data['mR'])]) /
-                    1.128).mean()
-            data_I['+1sd'] = baseline_data[self.target_col].mean() + 1 * (
-                    (baseline_data['mR'].iloc[1:len(baseline_data['mR'])]) /
-                    1.128).mean()
-            data_I['-1sd'] = baseline_data[self.target_col].mean() - 1 * (
-                    (baseline_data['mR'].iloc[1:len(baseline_data['mR'])]) /
-                    1.128).mean()
-            data_I['+2sd'] = baseline_data[self.target_col].mean() + 2 * (
-                    (baseline_data['mR'].iloc[1:len(baseline_data['mR'])]) /
-                    1.128).mean()
-            data_I['-2sd'] = baseline_data[self.target_col].mean() - 2 * (
-                    (baseline_data['mR'].iloc[1:len(baseline_data['mR'])]) /
-                    1.128).mean()
-
-            # mR chart
-            data_mR = data.copy()
-            data_mR['r'] = data[self.target_col].diff().abs().values
-            data_mR['cl'] = baseline_data['mR'].mean()
-            data_mR['lcl'] = 0
-            data_mR['ucl'] = baseline_data['mR'].mean() + 3.27 * (
-                baseline_data['mR'].iloc[1:len(baseline_data['mR'])].mean())
-
-            zone = (data_mR['ucl'] - data_mR['cl']).mean()
-
-            data_mR['+1sd'] = baseline_data['mR'].mean() - 1 * zone
-            data_mR['-1sd'] = baseline_data['mR'].mean() + 1 * zone
-            data_mR['+2sd'] = baseline_data['mR'].mean() - 2 * zone
-            data_mR['-2sd'] = baseline_data['mR'].mean() + 2 * zone
-            # These are probably not correctly calculated, but for consistency have kept in for now.
-
-            # Check lcl doesn't fall below 0.
-            if data_mR['lcl'][0] < 0:
-                data_mR['lcl'] = 0
-
-            if self.chart_type == 'Individual-chart':
-                return data_I, None
-
-            elif self.chart_type == 'XmR-chart':
-                return data_I, data_mR
-
-
-        elif self.chart_type == 'XbarR-chart':
-
-            data_x_bar = data.copy().reset_index(drop=False)
-            x_bar_df = data_x_bar.groupby(by=self._date_col).mean().reset_index(drop=False).rename(
-                columns={self.target_col: 'x_bar'})
-            x_bar_df['r'] = data_x_bar.groupby(by=self._date_col).max()[self.target_col].values - \
-                            data_x_bar.groupby(by=self._date_col).min()[
-                                self.target_col].values
-
-            df_r = x_bar_df[['r', self._date_col]].set_index(self._date_col,
-                                                             drop=True).rename(columns={'x_bar': self.target_col})
-            df_out = x_bar_df[['x_bar', self._date_col]].set_index(self._date_col,
-                                                                   drop=True).rename(columns={'x_bar': self.target_col})
-            df_out['cl'] = df_out.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean()
-            df_out['lcl'] = df_out.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - float(
-                x_bar_vals['A2'][self.sample_size]) * \
-                            df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean()
-            df_out['ucl'] = df_out.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + float(
-                x_bar_vals['A2'][self.sample_size]) * \
-                            df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean()
-
-            # Value to get each zone (A, B, C)
-            zone = ((df_out['ucl'] - df_out['cl']) / 3)[0]
-
-            df_out['+1sd'] = df_out['cl'] + zone
-            df_out['-1sd'] = df_out['cl'] - zone
-            df_out['+2sd'] = df_out['cl'] + 2 * zone
-            df_out['-2sd'] = df_out['cl'] - 2 * zone
-
-            # Check lcl doesn't fall below 0.
-            df_out['lcl'] = [x if x > 0 else 0 for x in df_out['lcl']]
-
-            df_out_R = pd.DataFrame()
-            df_out_R[self._date_col] = x_bar_df[self._date_col].values
-            df_out_R['r'] = x_bar_df['r'].values
-            df_out_R['cl'] = df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean()
-            df_out_R['lcl'] = df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean() * float(
-                x_bar_vals['D3'][self.sample_size])
-            df_out_R['ucl'] = df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean() * float(
-                x_bar_vals['D4'][self.sample_size])
-
-            zone_R = ((df_out_R['ucl'] - df_out_R['cl']) / 3)[0]
-
-            df_out_R['+1sd'] = df_out_R['cl'] + zone_R
-            df_out_R['-1sd'] = df_out_R['cl'] - zone_R
-            df_out_R['+2sd'] = df_out_R['cl'] + 2 * zone_R
-            df_out_R['-2sd'] = df_out_R['cl'] - 2 * zone_R
-
-            df_out_R = df_out_R.set_index(self._date_col, drop=True)
-
-            if df_out_R['lcl'][0] < 0:
-                df_out_R['lcl'] = 0
-
-            return df_out, df_out_R
-
-        elif self.chart_type == 'XbarS-chart':
-
-            data_x_bar = data.copy().reset_index(drop=False)
-
-            x_bar_df = data_x_bar.groupby(by=self._date_col).mean().reset_index(drop=False).rename(
-                columns={self.target_col: 'x_bar'})
-            x_bar_df['r'] = data_x_bar.groupby(by=self._date_col).max()[self.target_col].values - \
-                            data_x_bar.groupby(by=self._date_col).min()[
-                                self.target_col].values
-
-            df_r = x_bar_df[['r', self._date_col]].set_index(self._date_col, drop=True).rename(
-                columns={'x_bar': self.target_col})
-            df_out = x_bar_df[['x_bar', self._date_col]].set_index(self._date_col,
-                                                                   drop=True).rename(columns={'x_bar': self.target_col})
-            df_out['cl'] = df_out.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean()
-            df_out['lcl'] = df_out.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - float(
-                x_bar_vals['A3'][self.sample_size]) * \
-                            df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean()
-            df_out['ucl'] = df_out.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + float(
-                x_bar_vals['A3'][self.sample_size]) * \
-                            df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean()
-
-            zone = ((df_out['ucl'] - df_out['cl']) / 3)
+        # If we're not using baseline data, we set baseline data to last value of input data. (This is kept
+        # local, rather than updating self.baseline_date, as periods may be calculated in parallel.)
+        if (self.baseline_date is None) or (self.change_dates is not None):
+            baseline_ts = _tsdate(data.index[-1])
+        else:
+            baseline_ts = _tsdate(self.baseline_date)
+
+        # Find the position where the baseline period ends (the baseline date itself is included). Each chart
+        # type's _build_*() method slices its baseline by position with this.
+        baseline_pos = data.index.searchsorted(baseline_ts, side='right')
 
-            df_out['+1sd'] = df_out['cl'] + zone
-            df_out['-1sd'] = df_out['cl'] - zone
-            df_out['+2sd'] = df_out['cl'] + 2 * zone
-            df_out['-2sd'] = df_out['cl'] - 2 * zone
+        builder = self._dispatch.get(self.chart_type)
+        if builder is None:
+            raise _chart_type_error(self.chart_type)
 
-            # Check lcl doesn't fall below 0.
-            df_out['lcl'] = [x if x > 0 else 0 for x in df_out['lcl']]
+        return builder(data, baseline_ts, baseline_pos)
 
-            df_out_S = pd.DataFrame()
-            df_out_S[self._date_col] = x_bar_df[self._date_col].values
-            df_out_S['r'] = x_bar_df['r'].values
-            df_out_S['cl'] = df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean()
-            df_out_S['lcl'] = df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean() * float(
-                x_bar_vals['B3'][self.sample_size])
-            df_out_S['ucl'] = df_r.loc[:pd.to_datetime(self.baseline_date)]['r'].mean() * float(
-                x_bar_vals['B4'][self.sample_size])
+    def _build_xmr(self, data, baseline_ts, baseline_pos):
+
+        """
 
-            zone_R = ((df_out_S['ucl'] - df_out_S['cl']) / 3)
+        Calculates the control lines for the Individual chart (and the mR chart, for the XmR chart).
 
-            df_out_S['+1sd'] = df_out_S['cl'] + zone_R
-            df_out_S['-1sd'] = df_out_S['cl'] - zone_R
-            df_out_S['+2sd'] = df_out_S['cl'] + 2 * zone_R
-            df_out_S['-2sd'] = df_out_S['cl'] - 2 * zone_R
-
-            # Check lcl doesn't fall below 0.
-            if df_out_S['lcl'][0] < 0:
-                df_out_S['lcl'] = 0
-
-            df_out_S = df_out_S.set_index(self._date_col, drop=True)
-
-            return df_out, df_out_S
-
-        elif self.chart_type == 'c-chart':
+        Args:
+            data (pandas.DataFrame): Data input (with datetime index).
+            baseline_ts (pandas.Timestamp): Last date of the baseline period.
+            baseline_pos (int): Number of rows in the baseline period.
 
-            data_in = data.copy()
+        Returns:
+            tuple: Dataframes with control limits for each chart (the second is None for single charts).
 
-            data_in['cl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean()
-            data_in['lcl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - \
-                             (3 * ((data_in[self.target_col].mean()) ** 0.5))
-            data_in['ucl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + \
-                             (3 * ((data_in[self.target_col].mean()) ** 0.5))
+        """
 
-            data_in['+1sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + \
-                              (1 * ((data_in[self.target_col].mean()) ** 0.5))
-            data_in['-1sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - \
-                              (1 * ((data_in[self.target_col].mean()) ** 0.5))
-            data_in['+2sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + \
-                              (2 * ((data_in[self.target_col].mean()) ** 0.5))
-            data_in['-2sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - \
-                              (2 * ((data_in[self.target_col].mean()) ** 0.5))
+        # Moving range as a NumPy array (the first value has no predecessor, so is left missing).
+        y = data[self.target_col].to_numpy(dtype=self.precision)
+        moving_range = np.empty_like(y)
+        moving_range[:1] = np.nan
+        np.abs(np.subtract(y[1:], y[:-1], out=moving_range[1:]), out=moving_range[1:])
+
+        # Baseline statistics, calculated once and reused for each control line.
+        # (the first moving range is always missing, so it is skipped). They are kept at the chosen
+        # precision, so that the control line columns are stored at it too.
+        scalar = np.dtype(self.precision).type
+        mean = scalar(data[self.target_col].iloc[:baseline_pos].mean())
+        mR_mean = scalar(np.nanmean(moving_range[1:baseline_pos]))
+        sigma = scalar(mR_mean / 1.128)
+
+        # Individual chart
+        data_I = data.copy(deep=False)
+        SPC._assign_columns(data_I, SPC._sigma_lines(mean, sigma, clamp_lcl=False), dtype=self.precision)
+
+        if self.chart_type == 'Individual-chart':
+            return data_I, None
+
+        # mR chart
+        zone = 3.27 * mR_mean
+
+        # The +/- sd lines are probably not correctly calculated, but for consistency have kept in for now.
+        data_mR = data.copy(deep=False)
+        SPC._assign_columns(data_mR, {'r': moving_range,
+                                      'cl': mR_mean,
+                                      'lcl': 0,
+                                      'ucl': mR_mean + 3.27 * mR_mean,
+                                      '+1sd': mR_mean - 1 * zone,
+                                      '-1sd': mR_mean + 1 * zone,
+                                      '+2sd': mR_mean - 2 * zone,
+                                      '-2sd': mR_mean + 2 * zone}, dtype=self.precision)
+
+        return data_I, data_mR
+
+    def _build_xbar_r(self, data, baseline_ts, baseline_pos):
 
-            # Check lcl doesn't fall below 0.
-            data_in['lcl'] = [x if x > 0 else 0 for x in data_in['lcl']]
+        """
 
-            return data_in, None
+        Calculates the control lines for the XbarR chart (see _setup_xbar()).
 
-        elif self.chart_type == 'p-chart':
+        """
 
-            data_in = data.copy()
+        return self._setup_xbar(data, baseline_ts, 'A2', 'D3', 'D4')
 
-            data_in[self.target_col] = data_in[self.target_col] / data_in['n']
+    def _build_xbar_s(self, data, baseline_ts, baseline_pos):
 
-            data_in['cl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean()
-            data_in['lcl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - 3 * (
-                    (data_in[self.target_col].mean() *
-                     (1 - data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                    data_in.loc[:pd.to_datetime(self.baseline_date)]['n']) ** 0.5
+        """
 
-            data_in['ucl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + 3 * (
-                    (data_in[self.target_col].mean() * (
-                            1 - data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                    data_in.loc[:pd.to_datetime(self.baseline_date)]['n']) ** 0.5
+        Calculates the control lines for the XbarS chart (see _setup_xbar()).
 
-            data_in['+1sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + 1 * (
-                    (data_in[self.target_col].mean() *
-                     (1 - data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                    data_in.loc[:pd.to_datetime(self.baseline_date)]['n']) ** 0.5
+        """
 
-            data_in['-1sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - 1 * (
-                    (data_in[self.target_col].mean() * (
-                            1 - data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                    data_in.loc[:pd.to_datetime(self.baseline_date)]['n']) ** 0.5
+        return self._setup_xbar(data, baseline_ts, 'A3', 'B3', 'B4')
 
-            data_in['+2sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + 2 * (
-                    (data_in[self.target_col].mean() *
-                     (1 - data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                    data_in.loc[:pd.to_datetime(self.baseline_date)]['n']) ** 0.5
+    def _build_c(self, data, baseline_ts, baseline_pos):
 
-            data_in['-2sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - 2 * (
-                    (data_in[self.target_col].mean() * (
-                            1 - data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                    data_in.loc[:pd.to_datetime(self.baseline_date)]['n']) ** 0.5
+        """
 
-            # Check lcl doesn't fall below 0.
-            data_in['lcl'] = [x if x > 0 else 0 for x in data_in['lcl']]
+        Calculates the control lines for the c-chart.
 
-            return data_in, None
+        Args:
+            data (pandas.DataFrame): Data input (with datetime index).
+            baseline_ts (pandas.Timestamp): Last date of the baseline period.
+            baseline_pos (int): Number of rows in the baseline period.
 
-        elif self.chart_type == 'np-chart':
+        Returns:
+            tuple: Dataframes with control limits for each chart (the second is None for single charts).
 
-            data_in = data.copy()
+        """
 
-            p = data_in[self.target_col].loc[:pd.to_datetime(self.baseline_date)].sum() \
-                / data_in.loc[:pd.to_datetime(self.baseline_date)]['n'].sum()
+        data_in = data.copy(deep=False)
 
-            data_in['cl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean()
+        # Baseline mean and sigma, calculated once (sigma uses the mean over the whole period).
+        c_mean = data_in[self.target_col].iloc[:baseline_pos].mean()
+        sigma = data_in[self.target_col].mean() ** 0.5
 
-            data_in['ucl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() \
-                             + 3 * (data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() * (
-                    1 - p)) ** 0.5
+        SPC._assign_columns(data_in, SPC._sigma_lines(c_mean, sigma))
 
-            data_in['lcl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() \
-                             - 3 * (data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() * (
-                    1 - p)) ** 0.5
+        return data_in, None
 
-            data_in['+1sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() \
-                              + 1 * (data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() * (
-                    1 - p)) ** 0.5
-            data_in['-1sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() \
-                              - 1 * (data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() * (
-                    1 - p)) ** 0.5
+    def _build_p(self, data, baseline_ts, baseline_pos):
 
-            data_in['+2sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() \
-                              + 2 * (data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() * (
-                    1 - p)) ** 0.5
-            data_in['-2sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() \
-                              - 2 * (data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() * (
-                    1 - p)) ** 0.5
+        """
 
-            # Check lcl doesn't fall below 0.
-            data_in['lcl'] = [x if x > 0 else 0 for x in data_in['lcl']]
+        Calculates the control lines for the p-chart.
 
-            return data_in, None
+        Args:
+            data (pandas.DataFrame): Data input (with datetime index).
+            baseline_ts (pandas.Timestamp): Last date of the baseline period.
+            baseline_pos (int): Number of rows in the baseline period.
 
-        elif self.chart_type == 'u-chart':
+        Returns:
+            tuple: Dataframes with control limits for each chart (the second is None for single charts).
 
-            data_in = data.copy()
+        """
 
-            data_in[self.target_col] = data_in[self.target_col] / data_in['n']
+        data_in = data.copy(deep=False)
 
-            data_in['cl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean()
-            data_in['lcl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - 3 * \
-                             (((data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                              (data_in.loc[:pd.to_datetime(self.baseline_date)]['n'])) ** 0.5
-            data_in['ucl'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + 3 * \
-                             (((data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                              (data_in.loc[:pd.to_datetime(self.baseline_date)]['n'])) ** 0.5
+        data_in[self.target_col] = SPC._per_sample(data, self.target_col)
 
-            data_in['+1sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + 1 * \
-                              (((data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                               (data_in.loc[:pd.to_datetime(self.baseline_date)]['n'])) ** 0.5
+        # Baseline proportion and standard error, calculated once. The standard error is based on
+        # the baseline sample sizes (and the mean proportion over the whole period), so it is
+        # missing for points after the baseline period.
+        p = data_in[self.target_col].to_numpy(dtype=self.precision)
+        n = data_in['n'].to_numpy(dtype=self.precision)
+        p_mean = np.nanmean(p[:baseline_pos])
+        se = np.full(len(p), np.nan, dtype=self.precision)
+        se[:baseline_pos] = np.sqrt(np.nanmean(p) * (1 - p_mean) / n[:baseline_pos])
 
-            data_in['-1sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - 1 * \
-                              (((data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                               (data_in.loc[:pd.to_datetime(self.baseline_date)]['n'])) ** 0.5
+        SPC._assign_columns(data_in, SPC._sigma_lines(p_mean, se))
 
-            data_in['+2sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() + 2 * \
-                              (((data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                               (data_in.loc[:pd.to_datetime(self.baseline_date)]['n'])) ** 0.5
+        return data_in, None
 
-            data_in['-2sd'] = data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean() - 2 * \
-                              (((data_in.loc[:pd.to_datetime(self.baseline_date)][self.target_col].mean())) /
-                               (data_in.loc[:pd.to_datetime(self.baseline_date)]['n'])) ** 0.5
+    def _build_np(self, data, baseline_ts, baseline_pos):
 
-            # Check lcl doesn't fall below 0.
-            data_in['lcl'] = [x if x > 0 else 0 for x in data_in['lcl']]
+        """
 
-            return data_in, None
+        Calculates the control lines for the np-chart.
 
-        else:
-            print('Chart type must be one of "XmR-chart", "Individual-chart", "p-chart",  '
-                  '"np-chart", "c-chart", "u-chart", "XbarR-chart", XbarS-chart"')
+        Args:
+            data (pandas.DataFrame): Data input (with datetime index).
+            baseline_ts (pandas.Timestamp): Last date of the baseline period.
+            baseline_pos (int): Number of rows in the baseline period.
+
+        Returns:
+            tuple: Dataframes with control limits for each chart (the second is None for single charts).
+
+        """
+
+        data_in = data.copy(deep=False)
+
+        # Baseline statistics, calculated once.
+        baseline = data_in.iloc[:baseline_pos]
+        p = baseline[self.target_col].sum() / baseline['n'].sum()
+        np_mean = baseline[self.target_col].mean()
+        sigma = (np_mean * (1 - p)) ** 0.5
+
+        # (np-chart columns keep their original order, with ucl before lcl)
+        lines = SPC._sigma_lines(np_mean, sigma)
+        SPC._assign_columns(data_in, {col: lines[col]
+                                      for col in ('cl', 'ucl', 'lcl', '+1sd', '-1sd', '+2sd', '-2sd')})
+
+        return data_in, None
+
+    def _build_u(self, data, baseline_ts, baseline_pos):
+
+        """
+
+        Calculates the control lines for the u-chart.
+
+        Args:
+            data (pandas.DataFrame): Data input (with datetime index).
+            baseline_ts (pandas.Timestamp): Last date of the baseline period.
+            baseline_pos (int): Number of rows in the baseline period.
+
+        Returns:
+            tuple: Dataframes with control limits for each chart (the second is None for single charts).
+
+        """
+
+        data_in = data.copy(deep=False)
+
+        data_in[self.target_col] = SPC._per_sample(data, self.target_col)
+
+        # Baseline rate and sigma (based on the baseline sample sizes, so missing for points after
+        # the baseline period), calculated once.
+        u = data_in[self.target_col].to_numpy(dtype=self.precision)
+        n = data_in['n'].to_numpy(dtype=self.precision)
+        u_mean = np.nanmean(u[:baseline_pos])
+        sigma = np.full(len(u), np.nan, dtype=self.precision)
+        sigma[:baseline_pos] = np.sqrt(u_mean / n[:baseline_pos])
+
+        SPC._assign_columns(data_in, SPC._sigma_lines(u_mean, sigma))
+
+        return data_in, None
+
+    def _setup_xbar(self, data, baseline_ts, a_key, lo_key, hi_key):
+
+        """
+
+        Calculates the control lines for the XbarR and XbarS charts, which differ only in their chart constants.
+
+        Args:
+            data (pandas.DataFrame): Data input (with datetime index, several samples per date).
+            baseline_ts (pandas.Timestamp): Last date of the baseline period.
+            a_key (str): Constant for the Xbar chart limits ('A2' or 'A3').
+            lo_key (str): Constant for the spread chart lower limit ('D3' or 'B3').
+            hi_key (str): Constant for the spread chart upper limit ('D4' or 'B4').
+
+        Returns:
+            tuple: Dataframes with control limits for the Xbar chart and the spread chart.
+
+        """
+
+        # Mean and range of each sample, from a single groupby pass. Groups only need sorting if the dates
+        # are not already in order (first-seen order is then date order).
+        # The dates are grouped on the index directly, with no reset_index round trip.
+        samples = data[self.target_col].groupby(level=0, sort=not data.index.is_monotonic_increasing).agg(
+            ['mean', 'max', 'min'])
+
+        means = samples['mean'].to_numpy()
+        ranges = samples['max'].to_numpy() - samples['min'].to_numpy()
+
+        # Baseline statistics and chart constants, calculated once from the sample arrays.
+        # (samples are one row per date, so the baseline position is found on the sample index)
+        sample_baseline_pos = samples.index.searchsorted(baseline_ts, side='right')
+        x_bar_mean = np.nanmean(means[:sample_baseline_pos])
+        r_mean = np.nanmean(ranges[:sample_baseline_pos])
+        a = _xbar(a_key, self.sample_size)
+        lo = _xbar(lo_key, self.sample_size)
+        hi = _xbar(hi_key, self.sample_size)
+
+        # Value to get each zone (A, B, C)
+        zone = a * r_mean / 3
+        zone_r = r_mean * (hi - 1) / 3
+
+        # Each output frame is built once. lcl is not allowed to fall below 0.
+        df_out = pd.DataFrame({self.target_col: means,
+                               'cl': x_bar_mean,
+                               'lcl': np.fmax(x_bar_mean - a * r_mean, 0),
+                               'ucl': x_bar_mean + a * r_mean,
+                               '+1sd': x_bar_mean + zone,
+                               '-1sd': x_bar_mean - zone,
+                               '+2sd': x_bar_mean + 2 * zone,
+                               '-2sd': x_bar_mean - 2 * zone}, index=samples.index)
+
+        df_r = pd.DataFrame({'r': ranges,
+                             'cl': r_mean,
+                             'lcl': np.fmax(r_mean * lo, 0),
+                             'ucl': r_mean * hi,
+                             '+1sd': r_mean + zone_r,
+                             '-1sd': r_mean - zone_r,
+                             '+2sd': r_mean + 2 * zone_r,
+                             '-2sd': r_mean - 2 * zone_r}, index=samples.index)
+
+        return df_out, df_r
 
     def check_rules(self):
 
@@ -664,19 +1017,12 @@ class SPC:
 
         """
 
-        if self.chart_type in ("XmR-chart", "XbarR-chart", "XbarS-chart"):
-            self._target_col_x = self.target_col
-            self._target_col_y = 'r'
-        else:
-            self._target_col_x = self.target_col
-            self._target_col_y = None
-
         # Check rules for both graphs (checking second graph data is not None)
-        self._dict_rules_x = SPC._rules_func(self._formatted_data_x, self._target_col_x)
+        self._dict_rules_x = SPC._rules_func(*SPC._rule_inputs(self._formatted_data_x, self._target_col_x))
         if self._formatted_data_y is None:
             self._dict_rules_y = None
         else:
-            self._dict_rules_y = SPC._rules_func(self._formatted_data_y, self._target_col_y)
+            self._dict_rules_y = SPC._rules_func(*SPC._rule_inputs(self._formatted_data_y, self._target_col_y))
 
         # Defining rules applicable to each SPC chart type.
         if self.chart_type in ('XmR-chart', 'Individual-chart', 'XbarR-chart', 'XbarS-chart'):
@@ -702,104 +1048,224 @@ class SPC:
         if self.chart_type in ('np-chart', 'p-chart', 'u-chart', 'c-chart'):
             self._chart_name_x = self.chart_type
 
-        dictionary_x_first = self._dict_rules_x
-        dictionary_x = {key: value for key, value in dictionary_x_first.items() if key in self._rules_list_x}
         df_x = self._formatted_data_x
+        df_y = None if self._dict_rules_y is None else self._formatted_data_y
 
-        if self._dict_rules_y is not None:
-            dictionary_y_first = self._dict_rules_y
-            dictionary_y = {key: value for key, value in dictionary_y_first.items() if key in self._rules_list_y}
-            df_y = self._formatted_data_y
+        # Add columns with string headers and binary representation (1 if the date violates the rule),
+        # for the rules applicable to each chart. The columns are built first, then attached in one concat.
+        flags_x = {header: SPC._date_flags(df_x.index, self._dict_rules_x[header]) for header in self._rules_list_x}
+        flags_x['chart type'] = self._chart_name_x
+        self._data_x = pd.concat([df_x, pd.DataFrame(flags_x, index=df_x.index)], axis=1).reset_index()
+
+        if df_y is None:
+            self._data_y = None
         else:
-            df_y = None
+            flags_y = {header: SPC._date_flags(df_y.index, self._dict_rules_y[header])
+                       for header in self._rules_list_y}
+            flags_y['chart type'] = self._chart_name_y
 
-            # Function to check if a date exists in the dictionary list
+            self._data_y = pd.concat([df_y, pd.DataFrame(flags_y, index=df_y.index)], axis=1).reset_index()
 
-        def check_date(date, date_list):
-            return 1 if date in date_list else 0
+        # The combined spc_data dataframe is rebuilt from these on next access.
+        self._spc_data_cache = None
 
-        # Add columns with string headers and binary representation
-        for header, date_list in dictionary_x.items():
-            df_x[header] = df_x.reset_index()[self._date_col].apply(lambda x: check_date(x, date_list)).values
-        df_x['chart type'] = self._chart_name_x
-        self._data_x = df_x.reset_index()
+    def _render_data(self, data, target_col):
 
-        if df_y is None:
-            self._data_y = None
+        """
+
+        Downsamples a chart's data for plotting the value line, if it has more than max_render_points rows.
+        The plotted column keeps its shape (peaks and troughs are kept). The rows are picked from the plotted
+        column only, so the control lines are not drawn from them (see _control_line_traces()).
+
+        Args:
+            data (pandas.DataFrame): Chart data.
+            target_col (str): Name of the plotted column.
+
+        Returns:
+            pandas.DataFrame: Rows of data to plot.
+
+        """
+
+        if self.max_render_points is None or len(data) <= self.max_render_points:
+            return data
+
+        y = data[target_col].to_numpy(dtype=np.float64)
+        if _TSDOWNSAMPLE_AVAILABLE:
+            positions = MinMaxLTTBDownsampler().downsample(data.index.asi8, y, n_out=self.max_render_points)
         else:
-            for header, date_list in dictionary_y.items():
-                df_y[header] = df_y.reset_index()[self._date_col].apply(lambda x: check_date(x, date_list)).values
-            df_y['chart type'] = self._chart_name_y
+            # Split the points into equal buckets, and keep the first and last point plus the minimum and
+            # maximum of each bucket (found by sorting on bucket, then value).
+            n_buckets = max((self.max_render_points - 2) // 2, 1)
+            edges = np.linspace(0, len(y), n_buckets + 1).astype(np.int64)
+            order = np.lexsort((y, np.repeat(np.arange(n_buckets), np.diff(edges))))
+            positions = np.unique(np.concatenate(([0, len(y) - 1], order[edges[:-1]], order[edges[1:] - 1])))
+        return data.iloc[positions]
 
-            self._data_y = df_y.reset_index()
+    @staticmethod
+    def _step_positions(values):
 
-        self.spc_data = pd.concat([self._data_x, self._data_y])
+        """
 
-    def plot_spc(self, title='SPC Chart'):
+        Positions needed to draw a line exactly: every point which differs from one of its neighbours,
+        so only the first and last point of each constant run are kept (and every point of a varying line).
+
+        Args:
+            values (numpy.ndarray): Line values.
+
+        Returns:
+            numpy.ndarray: Positions of the points to keep.
 
         """
 
-        Requires setup() & check_rules() methods to be called first.
+        if len(values) < 3:
+            return np.arange(len(values))
+        same = (values[1:] == values[:-1]) | (np.isnan(values[1:]) & np.isnan(values[:-1]))
+        keep = np.ones(len(values), dtype=bool)
+        keep[1:-1] = ~(same[1:] & same[:-1])
+        return np.flatnonzero(keep)
 
-        Returns Plotly interactive plots for chosen SPC chart.
+    @staticmethod
+    def _control_line_traces(data, thin=False, scatter=go.Scatter):
 
         """
 
-        changepoint = self.baseline_date
+        Builds the centre line and control limit traces of one chart (not shown in the legend).
 
-        # This will create charts for SPC with only one chart.
-        if self._formatted_data_y is None:
+        Args:
+            data (pandas.DataFrame): Chart data with control line columns (every row).
+            thin (bool): Whether to leave out the inner points of constant runs, which do not change the
+                line drawn (e.g. when the chart is downsampled). Varying limits, as on p- and u-charts,
+                keep every point.
+            scatter (type): Trace type, go.Scatter or go.Scattergl.
+
+        Returns:
+            list: Plotly scatter traces.
+
+        """
+
+        traces = []
+        for column, color, width, name in CONTROL_LINE_STYLES:
+            x, y = data.index, data[column].to_numpy()
+            if thin:
+                positions = SPC._step_positions(y.astype(np.float64, copy=False))
+                x, y = x[positions], y[positions]
+            traces.append(scatter(x=x, y=y, line=dict(width=width, dash='dash', color=color),
+                                  opacity=0.5, name=name, showlegend=False))
+        return traces
+
+    @staticmethod
+    def _rule_marker_traces(index, values, rules_dict, rules_list, suffix='', marker_width=4, combine=False,
+                            scatter=go.Scatter):
 
-            data = self._formatted_data_x
+        """
 
-            rules_dict_first = self._dict_rules_x
-            rules_list_first = self._rules_list_x
+        Builds a marker trace for each rule, circling the points which violate it. If combine is True, a single
+        trace holds the violations of every rule, with the rule name of each point in its customdata.
 
-            fig = px.line(x=data.index,
-                          y=data[self.target_col],
-                          markers=False)
+        Args:
+            index (pandas.DatetimeIndex): Dates of the chart data.
+            values (numpy.ndarray): Plotted values, aligned with index.
+            rules_dict (dict): Rule violation dates, keyed by rule.
+            rules_list (list): Rules to show.
+            suffix (str): Text appended to each trace name.
+            marker_width (int): Line width of the markers.
+            combine (bool): Whether to draw all rules as one trace.
+            scatter (type): Trace type, go.Scatter or go.Scattergl.
 
-            fig.add_scatter(x=data.index, y=data['cl'], line_width=3, opacity=0.5, line_dash='dash', line_color='green',
-                            name='CENTRAL LINE')
-            fig.add_scatter(x=data.index, y=data['lcl'], line_width=2, opacity=0.5, line_dash='dash', line_color='red',
-                            name='LOWER CONTROL LINE')
-            fig.add_scatter(x=data.index, y=data['ucl'], line_width=2, opacity=0.5, line_dash='dash', line_color='red',
-                            name='UPPER CONTROL LINE')
+        Returns:
+            list: Plotly scatter traces.
 
-            for idx, rule in enumerate(rules_list_first):
-                fig.add_trace(
-                    go.Scatter(name=rule, x=rules_dict_first[rule], y=data.loc[rules_dict_first[rule]][self.target_col],
-                               mode='markers',
-                               marker=dict(symbol='circle-open', opacity=1,
-                                           size=12,
-                                           line=dict(width=3))))
+        """
 
-            fig['layout']['xaxis']['title'] = ''
-            fig['layout']['yaxis']['title'] = 'Process'
-            fig.update_layout(title=title)
+        marker = dict(symbol='circle-open', opacity=1, size=12, line=dict(width=marker_width))
 
-            fig['layout']['yaxis'].update(autorange=True)
-            fig['layout']['xaxis'].update(autorange=True)
+        if combine:
+            dates = [rules_dict[rule] for rule in rules_list]
+            x = np.concatenate([np.asarray(d) for d in dates])
+            return [scatter(name='Rule violations' + suffix, x=x,
+                            y=values[index.get_indexer_for(x)],
+                            customdata=np.repeat(rules_list, [len(d) for d in dates]),
+                            hovertemplate='%{customdata}<br>%{x}<br>%{y}<extra></extra>',
+                            mode='markers', marker=marker)]
 
-            # Don't show all legend labels
-            fig.update_traces(showlegend=False, selector=dict(name='CENTRAL LINE'))
-            fig.update_traces(showlegend=False, selector=dict(name='LOWER CONTROL LINE'))
-            fig.update_traces(showlegend=False, selector=dict(name='UPPER CONTROL LINE'))
+        # Values at each rule violation, looked up by position
+        return [scatter(name=rule + suffix, x=rules_dict[rule],
+                        y=values[index.get_indexer_for(rules_dict[rule])],
+                        mode='markers',
+                        marker=marker)
+                for rule in rules_list]
 
-            fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="left"))
+    def _panel_traces(self, data, target_col, rules_dict, rules_list, value_line=None, suffix='', marker_width=4):
 
-            return fig
+        """
 
-        else:
+        Builds all traces for one chart panel: the plotted value, the control lines
+        and the rule markers.
 
-            data = self._formatted_data_x
-            data_var = self._formatted_data_y
+        Args:
+            data (pandas.DataFrame): Chart data.
+            target_col (str): Name of the plotted column.
+            rules_dict (dict): Rule violation dates, keyed by rule.
+            rules_list (list): Rules to show.
+            value_line (dict): Keyword arguments of the value trace (e.g. name, line), None to leave it out.
+            suffix (str): Text appended to each rule marker name.
+            marker_width (int): Line width of the markers.
 
-            rules_dict_first = self._dict_rules_x
-            rules_list_first = self._rules_list_x
+        Returns:
+            list: Plotly traces.
 
-            rules_dict_second = self._dict_rules_y
-            rules_list_second = self._rules_list_y
+        """
+
+        # Rule markers and control lines use the full data, only the value line may be downsampled.
+        # The target column is read into an array once and shared by the value line and markers.
+        render = self._render_data(data, target_col)
+        values = data[target_col].to_numpy()
+        render_values = values if render is data else render[target_col].to_numpy()
+
+        # One trace type for the whole panel: WebGL for long series, SVG otherwise.
+        scatter = go.Scattergl if len(data) > WEBGL_MIN_POINTS else go.Scatter
+
+        traces = []
+        if value_line is not None:
+            traces.append(scatter(x=render.index, y=render_values, showlegend=False, **value_line))
+        traces += SPC._control_line_traces(data, thin=render is not data, scatter=scatter)
+        traces += SPC._rule_marker_traces(data.index, values, rules_dict, rules_list, suffix=suffix,
+                                          marker_width=marker_width, combine=self.combine_rule_markers,
+                                          scatter=scatter)
+
+        return traces
+
+    def plot_spc(self, title='SPC Chart'):
+
+        """
+
+        Requires setup() & check_rules() methods to be called first.
+
+        Returns Plotly interactive plots for chosen SPC chart.
+
+        """
+
+        changepoint = self.baseline_date
+
+        # This will create charts for SPC with only one chart.
+        if self._formatted_data_y is None:
+
+            traces = self._panel_traces(self._formatted_data_x, self.target_col, self._dict_rules_x,
+                                        self._rules_list_x, marker_width=3,
+                                        value_line=dict(name='Value', mode='lines', line=dict(color='#636efa')))
+
+            # All traces are added, and the layout set, in one call each
+            fig = go.Figure(traces)
+
+            fig.update_layout(title=title,
+                              margin=dict(t=60),
+                              xaxis=dict(title='', autorange=True),
+                              yaxis=dict(title='Process', autorange=True),
+                              legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="left"))
+
+            return fig
+
+        else:
 
             if self.chart_type == 'XbarS-chart':
                 moving_range = "mS"
@@ -808,68 +1274,23 @@ class SPC:
 
             fig = make_subplots(rows=2, cols=1, row_heights=[0.7, 0.3], shared_xaxes=True, vertical_spacing=0.01)
 
-            fig.add_trace(go.Scatter(x=data.index,
-                                     y=data[self.target_col], line=dict(color="blue"), name='Value'), row=1, col=1)
-
-            fig.add_scatter(x=data.index, y=data['cl'], line_width=3, opacity=0.5, line_dash='dash', line_color='green',
-                            name='CENTRAL LINE', row=1, col=1)
-            fig.add_scatter(x=data.index, y=data['lcl'], line_width=2, opacity=0.5, line_dash='dash', line_color='red',
-                            name='LOWER CONTROL LINE', row=1, col=1)
-            fig.add_scatter(x=data.index, y=data['ucl'], line_width=2, opacity=0.5, line_dash='dash', line_color='red',
-                            name='UPPER CONTROL LINE', row=1, col=1)
-
-            for idx, rule in enumerate(rules_list_first):
-                fig.add_trace(
-                    go.Scatter(name=rule, x=rules_dict_first[rule], y=data.loc[rules_dict_first[rule]][self.target_col],
-                               mode='markers',
-                               marker=dict(symbol='circle-open', opacity=1,
-                                           size=12,
-                                           line=dict(width=4))), row=1, col=1)
-
-            fig.add_trace(go.Scatter(x=data_var.index,
-                                     y=data_var['r'], line=dict(color="grey"), name='Moving Range'),
-                          row=2, col=1)
-
-            fig.add_scatter(x=data_var.index, y=data_var['cl'], line_width=3, opacity=0.5, line_dash='dash',
-                            line_color='green',
-                            name='CENTRAL LINE', row=2, col=1)
-            fig.add_scatter(x=data_var.index, y=data_var['lcl'], line_width=2, opacity=0.5, line_dash='dash',
-                            line_color='red',
-                            name='LOWER CONTROL LINE', row=2, col=1)
-            fig.add_scatter(x=data_var.index, y=data_var['ucl'], line_width=2, opacity=0.5, line_dash='dash',
-                            line_color='red',
-                            name='UPPER CONTROL LINE', row=2, col=1)
-
-            for idx, rule in enumerate(rules_list_second):
-                fig.add_trace(go.Scatter(name=rule + f' ({moving_range})', x=rules_dict_second[rule],
-                                         y=data_var.loc[rules_dict_second[rule]]['r'],
-                                         mode='markers',
-                                         marker=dict(symbol='circle-open', opacity=1,
-                                                     size=12,
-                                                     line=dict(width=4))), row=2, col=1)
-
-            fig.update_layout(title=title)
-
-            fig['layout']['yaxis'].update(autorange=True)
-            fig['layout']['xaxis'].update(autorange=True)
-
-            fig.update_yaxes(title_text="Process", row=1, col=1)
-            fig.update_xaxes(title_text="", row=2, col=1)
-            fig.update_yaxes(title_text=moving_range, row=2, col=1)
-
-            # Don't show all legend labels
-            fig.update_traces(showlegend=False, selector=dict(name='CENTRAL LINE'), row=2, col=1)
-            fig.update_traces(showlegend=False, selector=dict(name='LOWER CONTROL LINE'), row=2, col=1)
-            fig.update_traces(showlegend=False, selector=dict(name='UPPER CONTROL LINE'), row=2, col=1)
-
-            fig.update_traces(showlegend=False, selector=dict(name='CENTRAL LINE'), row=1, col=1)
-            fig.update_traces(showlegend=False, selector=dict(name='LOWER CONTROL LINE'), row=1, col=1)
-            fig.update_traces(showlegend=False, selector=dict(name='UPPER CONTROL LINE'), row=1, col=1)
-
-            fig.update_traces(showlegend=False, selector=dict(name='Value'), row=1, col=1)
-            fig.update_traces(showlegend=False, selector=dict(name='Moving Range'), row=2, col=1)
-
-            fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.4, xanchor="left"))
+            # Only the rule markers are shown in the legend
+            traces_first = self._panel_traces(self._formatted_data_x, self.target_col, self._dict_rules_x,
+                                              self._rules_list_x, value_line=dict(name='Value', line=dict(color='blue')))
+            traces_second = self._panel_traces(self._formatted_data_y, 'r', self._dict_rules_y, self._rules_list_y,
+                                               value_line=dict(name='Moving Range', line=dict(color='grey')),
+                                               suffix=f' ({moving_range})')
+
+            # All traces are added, and the layout set, in one call each
+            fig.add_traces(traces_first + traces_second,
+                           rows=[1] * len(traces_first) + [2] * len(traces_second),
+                           cols=1)
+
+            fig.update_layout(title=title,
+                              xaxis=dict(autorange=True),
+                              yaxis=dict(title_text="Process", autorange=True),
+                              xaxis2=dict(title_text=""),
+                              yaxis2=dict(title_text=moving_range),
+                              legend=dict(orientation="h", yanchor="bottom", y=-0.4, xanchor="left"))
 
             return fig
-